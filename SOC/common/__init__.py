@@ -1,5 +1,5 @@
 """common"""
-from .simulation import Simulation, clean_boundary_inplace
+from .simulation import Simulation, clean_boundary_inplace, mark_visited, count_visited, find_active_sites, parallel_topple
 from matplotlib import pyplot as plt
 
 
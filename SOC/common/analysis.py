@@ -3,13 +3,22 @@ import matplotlib.pyplot as plt
 import numpy as np
 
 def plot_histogram(df, column='AvalancheSize', num=50, filename = None, plot = True):
-    min_range = np.log10(df[column].min()+1)
-    bins = np.logspace(min_range,
-                       np.log10(df[column].max()+1),
-                       num = num)
+    """
+    Histogram `column` of `df` in log-uniformly spaced bins.
+
+    `df` can be a DataFrame or any mapping of column names to arrays,
+    such as `Simulation.data`; the histogram itself is computed in NumPy.
+    """
+    data = np.asarray(df[column])
+    # bin limits as Python floats: no NumPy scalar promotion, and no
+    # wraparound of the +1 at the top of small integer dtypes
+    min_range = np.log10(float(data.min()) + 1)
+    max_range = np.log10(float(data.max()) + 1)
+    bins = np.logspace(min_range, max_range, num = num)
+    heights, bins = np.histogram(data, bins)
     if plot == "pass":
         fig, ax = plt.subplots()
-        heights, bins, _ = ax.hist(df[column], bins, label="Data (log-uniformly spaced bins)")
+        ax.bar(bins[:-1], heights, width=np.diff(bins), align='edge', label="Data (log-uniformly spaced bins)")
         ax.set_yscale('log')
         ax.set_xscale('log')
         ax.set_xlabel(column)
@@ -21,10 +30,9 @@ def plot_histogram(df, column='AvalancheSize', num=50, filename = None, plot = T
             plt.show()
     else:
         fig = None
-        heights, bins = np.histogram(df[column], bins)
     return heights, bins, fig
 
-@numba.njit
+@numba.njit('UniTuple(i8, 2)(b1[:])', cache=True, boundscheck=False)
 def find_largest_true_block(arr):
     """
     Given a boolean numpy array, finds the starting and ending indices
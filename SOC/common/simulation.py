@@ -9,6 +9,8 @@ import seaborn
 from . import analysis
 import zarr
 import datetime
+import os
+from concurrent.futures import ProcessPoolExecutor
 
 class Simulation:
     """Base class for SOC simulations."""
@@ -16,21 +18,45 @@ class Simulation:
     saved_snapshots = NotImplemented
 
     BOUNDARY_SIZE = BC = 1
-    def __init__(self, L: int, save_every: int = 1, wait_for_n_iters: int = 10):
+    # target uncompressed size of one automatically sized snapshot chunk;
+    # snapshots are buffered in memory and written to zarr one chunk at a time
+    SNAPSHOT_CHUNK_BYTES = 8 * 1024**2
+    # columns returned by `AvalancheLoop` and collected during `run`
+    OBSERVABLES = ('AvalancheSize', 'NumberOfReleases', 'number_of_iterations')
+    # snapshot series larger than this get animation colour limits from a
+    # sample of frames instead of an exact scan
+    ANIMATE_EXACT_LIMITS_BYTES = 1024**3
+    def __init__(self, L: int, save_every: int = 1, wait_for_n_iters: int = 10,
+                 snapshot_chunks: tuple = None):
         """__init__
 
         :param L: linear size of lattice, without boundary layers
         :type L: int
         :param save_every: number of iterations per snapshot save
         :type save_every: int or None
+        :param snapshot_chunks: zarr chunk shape (time, x, y) for saved snapshots.
+                                By default whole frames are stored, `SNAPSHOT_CHUNK_BYTES`
+                                worth of them per chunk - good for reading frames
+                                (animations, `from_file`). Smaller spatial chunks with more
+                                frames, e.g. (1000, 16, 16), favour reading the time series
+                                of a few sites, at the cost of touching many chunks per frame.
+        :type snapshot_chunks: tuple or None
         """
         self.L = L
-        self.visited = np.zeros((self.L_with_boundary, self.L_with_boundary), dtype=bool)
-        self.data_acquisition = []
+        self.snapshot_chunks = snapshot_chunks
+        # visited sites packed as a bitset, one bit per site; see `mark_visited`
+        self.visited = np.zeros((self.L_with_boundary**2 + 63) // 64, dtype=np.uint64)
+        # collected observables, one preallocated column per observable
+        self._observables = {name: np.empty(0, dtype=np.int64) for name in self.OBSERVABLES}
+        self._n_observations = 0
         self.save_every = save_every
         self.wait_for_n_iters = wait_for_n_iters
         # zliczanie relaksacji
-        self.releases = np.zeros((self.L_with_boundary, self.L_with_boundary), dtype=int)
+        self.releases = np.zeros((self.L_with_boundary, self.L_with_boundary), dtype=np.int64)
+        # snapshots waiting to be written to zarr, see `_buffer_snapshot`
+        self._snapshot_buffer = None
+        self._snapshot_buffer_index = 0
+        self._snapshot_offset = 0
 
     @property
     def size(self):
@@ -40,6 +66,24 @@ class Simulation:
     def L_with_boundary(self):
         return self.L + 2 * self.BOUNDARY_SIZE
 
+    @property
+    def interior(self) -> np.ndarray:
+        """View of `values` without the boundary layers."""
+        return self.values[self.BOUNDARY_SIZE:-self.BOUNDARY_SIZE, self.BOUNDARY_SIZE:-self.BOUNDARY_SIZE]
+
+    @classmethod
+    def values_dtype(cls) -> np.dtype:
+        """
+        dtype of the lattice `values`.
+
+        The sandpile-like models only ever hold a handful of grains per site,
+        which fits in a byte and keeps the lattice (and its snapshots) small.
+        Models with continuous or larger values should override this.
+
+        :rtype: np.dtype
+        """
+        return np.dtype(np.uint8)
+
     def drive(self):
         """
         Drive the simulation by adding particles from the outside.
@@ -65,7 +109,7 @@ class Simulation:
         :type array: np.ndarray
         :rtype: np.ndarray
         """
-        return clean_boundary_inplace(array, self.BOUNDARY_SIZE)
+        return clean_boundary_inplace(array, cls.BOUNDARY_SIZE)
 
     def AvalancheLoop(self) -> dict:
         """
@@ -77,12 +121,16 @@ class Simulation:
 
         :rtype: dict
         """
-        self.visited[...] = False
-        self.releases[...] = 0
+        # `visited` and `releases` are kept clean between avalanches, so they
+        # only need clearing after an avalanche that actually toppled something
         number_of_iterations = self.topple_dissipate()
-        
-        AvalancheSize = self.visited.sum()
+        if not number_of_iterations:
+            return dict(AvalancheSize=0, NumberOfReleases=0, number_of_iterations=0)
+
+        AvalancheSize = count_visited(self.visited)
         NumberOfReleases = self.releases.sum()
+        self.visited[...] = 0
+        self.releases[...] = 0
         return dict(AvalancheSize=AvalancheSize, NumberOfReleases=NumberOfReleases, number_of_iterations=number_of_iterations)
 
     def run(self, N_iterations: int,
@@ -96,7 +144,8 @@ class Simulation:
         :param N_iterations: number of iterations (per grid node if `scale` is True)
         :type N_iterations: int
         :rtype: dict
-        :param filename: filename for saving snapshots. if None, saves to memory; by default if False, makes something like array_Manna_2019-12-17T19:40:00.546426.zarr
+        :param filename: filename for saving snapshots. if None, saves to memory; by default if False, makes something like array_Manna_2019-12-17T19:40:00.546426.zarr;
+                         names ending in .zip are written as a single zip archive instead of a directory tree
         :type filename: str
         :param wait_for_n_iters: wait this many iterations before collecting data
                                  (lets model thermalize)
@@ -111,39 +160,142 @@ class Simulation:
         print(f"Waiting for wait_for_n_iters={wait_for_n_iters} iterations before collecting data. This should let the system thermalize.")
 
         total_snapshots = max([scaled_n_iterations // self.save_every, 1])
-        self.saved_snapshots = zarr.open(filename,
+        chunks = self.snapshot_chunks or self._auto_chunks(total_snapshots)
+        self.saved_snapshots = zarr.open(_snapshot_store(filename, mode='w'),
                                          shape=(
                                              total_snapshots,                            # czas
                                              self.L_with_boundary,                       # x
                                              self.L_with_boundary,                       # y
                                          ),
-                                         chunks=(
-                                             100,
-                                             self.L_with_boundary,
-                                             self.L_with_boundary,
-                                         ),
+                                         chunks=chunks,
                                          dtype=self.values.dtype,
+                                         codecs=[
+                                             zarr.codecs.BytesCodec(),
+                                             zarr.codecs.BloscCodec(cname='zstd', clevel=3, shuffle='bitshuffle'),
+                                         ],
+                                         # chunks that are all zero are not stored at all
+                                         config={'write_empty_chunks': False},
+                                         # set up front; rewriting metadata would duplicate it inside a zip archive
+                                         attributes={'save_every': self.save_every},
                                          )
-        self.saved_snapshots.attrs['save_every'] = self.save_every
-
-        for i in tqdm.trange(scaled_n_iterations):
-            self.drive()
-            observables = self.AvalancheLoop()
-            if i >= scaled_wait_for_n_iters:
-                self.data_acquisition.append(observables)
-            if self.save_every is not None and (i % self.save_every) == 0:
-                self._save_snapshot(i)
+        self._snapshot_buffer = np.empty((self.saved_snapshots.chunks[0], self.L_with_boundary, self.L_with_boundary),
+                                         dtype=self.saved_snapshots.dtype)
+        self._snapshot_buffer_index = 0
+        self._snapshot_offset = 0
+        self._reserve_observations(N_iterations)
+
+        try:
+            # redraw the progress bar at most ~1000 times, and not more than twice a second
+            for i in tqdm.trange(scaled_n_iterations,
+                                 miniters=max(1, scaled_n_iterations // 1000),
+                                 mininterval=0.5,
+                                 smoothing=0,
+                                 ):
+                self.drive()
+                observables = self.AvalancheLoop()
+                if i >= scaled_wait_for_n_iters:
+                    self._record_observables(observables)
+                if self.save_every is not None and (i % self.save_every) == 0:
+                    self._save_snapshot(i)
+        finally:
+            # keep the snapshots taken so far even if the run is interrupted
+            self.close()
         return filename
 
+    def _reserve_observations(self, n: int):
+        """
+        Make room for `n` more observations, growing the columns geometrically.
+
+        :param n: number of observations about to be recorded
+        :type n: int
+        """
+        needed = self._n_observations + n
+        capacity = len(self._observables[self.OBSERVABLES[0]])
+        if needed > capacity:
+            capacity = max(needed, 2 * capacity)
+            for name, column in self._observables.items():
+                grown = np.empty(capacity, dtype=column.dtype)
+                grown[:self._n_observations] = column[:self._n_observations]
+                self._observables[name] = grown
+
+    def _record_observables(self, observables: dict):
+        """
+        Store one `AvalancheLoop` result in the observable columns.
+
+        :param observables: result of `AvalancheLoop`
+        :type observables: dict
+        """
+        self._reserve_observations(1)
+        for name, column in self._observables.items():
+            column[self._n_observations] = observables[name]
+        self._n_observations += 1
+
+    def _auto_chunks(self, total_snapshots: int) -> tuple:
+        """
+        Chunk shape holding whole frames, about `SNAPSHOT_CHUNK_BYTES` of them uncompressed.
+
+        :param total_snapshots: number of snapshots the run will save
+        :type total_snapshots: int
+        :rtype: tuple
+        """
+        frame_bytes = self.L_with_boundary**2 * self.values.dtype.itemsize
+        frames_per_chunk = min(total_snapshots, max(1, self.SNAPSHOT_CHUNK_BYTES // frame_bytes))
+        return (frames_per_chunk, self.L_with_boundary, self.L_with_boundary)
+
     def _save_snapshot(self, i):
-        self.saved_snapshots[i // self.save_every] = self.values
+        self._buffer_snapshot(self.values)
+
+    def _buffer_snapshot(self, snapshot: np.ndarray):
+        """
+        Queue `snapshot` for saving; writes to zarr once a full chunk is buffered.
+
+        :param snapshot: array to save, same shape as `values`
+        :type snapshot: np.ndarray
+        """
+        self._snapshot_buffer[self._snapshot_buffer_index] = snapshot
+        self._snapshot_buffer_index += 1
+        if self._snapshot_buffer_index == len(self._snapshot_buffer):
+            self._flush_snapshots()
+
+    def _flush_snapshots(self):
+        """Write all buffered snapshots to `saved_snapshots` in a single slice assignment."""
+        n = self._snapshot_buffer_index
+        if n:
+            start = self._snapshot_offset
+            self.saved_snapshots[start:start + n] = self._snapshot_buffer[:n]
+            self._snapshot_offset += n
+            self._snapshot_buffer_index = 0
+
+    def close(self):
+        """
+        Write out any snapshots still waiting in the buffer.
+
+        Snapshots saved to a zip archive are only readable once the archive
+        is closed, so it is closed here and `saved_snapshots` reopened read-only.
+        Zip archives are left closed; zarr reopens them read-only when read.
+
+        Called automatically at the end of `run`, also when it is interrupted.
+        """
+        self._flush_snapshots()
+        store = getattr(self.saved_snapshots, 'store', None)
+        if isinstance(store, zarr.storage.ZipStore):
+            store.close()
+            if not store.read_only:
+                self.saved_snapshots = _open_snapshots(str(store.path))
+                _close_zip_store(self.saved_snapshots)
+
+    @property
+    def data(self) -> dict:
+        """Collected observables as a dict of NumPy arrays (views, no copies)."""
+        return {name: column[:self._n_observations]
+                for name, column in self._observables.items()}
 
     @property
     def data_df(self):
-        return pandas.DataFrame(self.data_acquisition)
+        return pandas.DataFrame(self.data)
 
     def plot_histogram(self, column='AvalancheSize', num=50, filename = None, plot = True):
-        return analysis.plot_histogram(self.data_df, column, num, filename, plot)
+        return analysis.plot_histogram(self.data, column, num, filename, plot)
 
     def plot_state(self, with_boundaries = False):
         """
@@ -154,7 +306,7 @@ class Simulation:
         if with_boundaries:
             values = self.values
         else:
-            values = self.values[self.BOUNDARY_SIZE:-self.BOUNDARY_SIZE, self.BOUNDARY_SIZE:-self.BOUNDARY_SIZE]
+            values = self.interior
         
         IM = ax.imshow(values, interpolation='nearest')
         
@@ -175,23 +327,57 @@ class Simulation:
         """
         fig, ax = plt.subplots()
 
+        snapshots = self.saved_snapshots
+        iterations = snapshots.shape[0]
+        frames_per_chunk = snapshots.chunks[0]
+        interior = np.s_[self.BOUNDARY_SIZE:-self.BOUNDARY_SIZE, self.BOUNDARY_SIZE:-self.BOUNDARY_SIZE]
+
         if with_boundaries:
-            values = np.dstack(self.saved_snapshots)
+            crop = np.s_[:]
         else:
-            values = np.dstack(self.saved_snapshots)[self.BOUNDARY_SIZE:-self.BOUNDARY_SIZE, self.BOUNDARY_SIZE:-self.BOUNDARY_SIZE, :]
-
-        IM = ax.imshow(values[:, :, 0],
+            crop = (slice(None),) + interior
+
+        if snapshots.nbytes <= self.ANIMATE_EXACT_LIMITS_BYTES:
+            # exact colour limits, reading one zarr chunk at a time
+            vmin, vmax = np.inf, -np.inf
+            for start in range(0, iterations, frames_per_chunk):
+                frames = snapshots[start:start + frames_per_chunk][crop]
+                vmin = min(vmin, frames.min())
+                vmax = max(vmax, frames.max())
+        else:
+            # too big to scan; colour limits from an evenly strided sample
+            sample = snapshots[::max(1, iterations // 16)][crop]
+            vmin, vmax = sample.min(), sample.max()
+
+        # frames are read lazily, one zarr chunk at a time
+        chunk = dict(start=None, frames=None)
+
+        def get_frame(i):
+            start = i - i % frames_per_chunk
+            if chunk['start'] != start:
+                chunk['start'] = start
+                chunk['frames'] = snapshots[start:start + frames_per_chunk]
+            frame = chunk['frames'][i - start]
+            return frame if with_boundaries else frame[interior]
+
+        # every frame is copied into the same array, so the image keeps one stable buffer
+        scratch = np.array(get_frame(0))
+        IM = ax.imshow(scratch,
                        interpolation='nearest',
-                       vmin = values.min(),
-                       vmax = values.max()
+                       vmin = vmin,
+                       vmax = vmax
                        )
         
         plt.colorbar(IM)
-        iterations = values.shape[2]
-        title = ax.set_title("Iteration {}/{}".format(0, iterations * self.save_every))
+        # drawn inside the axes (not as the axes title) so blitting redraws it cleanly
+        title = ax.text(0.5, 0.98, "Iteration {}/{}".format(0, iterations * self.save_every),
+                        transform=ax.transAxes, ha='center', va='top',
+                        bbox=dict(facecolor='white', alpha=0.8),
+                        )
 
         def animate(i):
-            IM.set_data(values[:,:,i])
+            np.copyto(scratch, get_frame(i))
+            IM.set_data(scratch)
             title.set_text("Iteration {}/{}".format(i * self.save_every, iterations * self.save_every))
             return IM, title
 
@@ -199,6 +385,7 @@ class Simulation:
                                        animate,
                                        frames=iterations,
                                        interval=interval,
+                                       blit=True,
                                        )
         if notebook:
             from IPython.display import HTML, display
@@ -208,19 +395,120 @@ class Simulation:
             return anim
     
     def get_exponent(self, *args, **kwargs):
-        return analysis.get_exponent(self.data_df, *args, **kwargs)
+        return analysis.get_exponent(self.data, *args, **kwargs)
+
+    @classmethod
+    def run_ensemble(cls, N_iterations: int, K: int, n_workers: int = None,
+                     filename: str = None, wait_for_n_iters: int = 10, **kwargs) -> dict:
+        """
+        Run `K` independent replicas of the model in parallel processes.
+
+        Every replica gets its own random seed. Their observables are
+        concatenated, so the result can go straight into
+        `analysis.plot_histogram` or `analysis.get_exponent`.
+
+        :param N_iterations: number of iterations per replica
+        :type N_iterations: int
+        :param K: number of replicas
+        :type K: int
+        :param n_workers: number of worker processes; by default one per CPU
+        :type n_workers: int or None
+        :param filename: directory to save snapshots in, replica `k` under `replica_k`;
+                         if None, snapshots are kept in memory and discarded
+        :type filename: str or None
+        :param wait_for_n_iters: wait this many iterations before collecting data
+        :type wait_for_n_iters: int
+        :param kwargs: passed on to the model's constructor, e.g. `L`
+        :rtype: dict
+        """
+        if filename is not None:
+            if filename.endswith('.zip'):
+                raise ValueError("Replicas cannot share one zip archive; pass a directory name instead")
+            zarr.open_group(filename, mode='a')
+        seeds = np.random.SeedSequence().generate_state(K)
+        with ProcessPoolExecutor(max_workers=n_workers) as executor:
+            futures = [executor.submit(_run_replica, cls, kwargs, N_iterations, wait_for_n_iters,
+                                       None if filename is None else os.path.join(filename, f"replica_{k}"),
+                                       int(seeds[k]))
+                       for k in range(K)]
+            replicas = [future.result() for future in futures]
+        return {name: np.concatenate([replica[name] for replica in replicas])
+                for name in cls.OBSERVABLES}
 
     @classmethod
     def from_file(cls, filename):
-        saved_snapshots = zarr.open(filename)
+        saved_snapshots = _open_snapshots(filename)
         save_every = saved_snapshots.attrs['save_every']
         L = saved_snapshots.shape[1] - 2 * cls.BOUNDARY_SIZE
         self = cls(L=L, save_every=save_every)
-        self.values = saved_snapshots[-1]
+        # stores written before the lattice dtypes were narrowed hold e.g. int64;
+        # the compiled kernels only accept the model's own dtype
+        values = saved_snapshots[-1]
+        dtype = self.values.dtype
+        if np.issubdtype(dtype, np.integer) and values.size:
+            info = np.iinfo(dtype)
+            if values.min() < info.min or values.max() > info.max:
+                raise ValueError(f"Saved values span [{values.min()}, {values.max()}], outside the range of {cls.__name__}'s {dtype} lattice")
+        self.values = values.astype(dtype)
         self.saved_snapshots = saved_snapshots
+        _close_zip_store(saved_snapshots)
         return self
         
-@numba.njit
+def _run_replica(cls, kwargs: dict, N_iterations: int, wait_for_n_iters: int, filename, seed: int) -> dict:
+    """Worker for `Simulation.run_ensemble`: seed, build and run one replica, return its observables."""
+    np.random.seed(seed)
+    _seed_numba(seed)
+    sim = cls(**kwargs)
+    sim.run(N_iterations, filename=filename, wait_for_n_iters=wait_for_n_iters)
+    return sim.data
+
+@numba.njit('void(i8)', cache=True)
+def _seed_numba(seed: int):
+    """Numba keeps its own random state, separate from NumPy's; seed it from nopython mode."""
+    np.random.seed(seed)
+
+def _open_snapshots(filename):
+    """Open saved snapshots read-only."""
+    return zarr.open(_snapshot_store(filename, mode='r'), mode='r')
+
+def _close_zip_store(saved_snapshots):
+    """
+    Close the file handle of snapshots read from a zip archive, if any.
+
+    zarr reopens a read-only archive by itself the next time the
+    snapshots are read, so they stay usable.
+    """
+    if isinstance(saved_snapshots.store, zarr.storage.ZipStore):
+        saved_snapshots.store.close()
+
+def _snapshot_store(filename, mode: str):
+    """
+    Store for snapshots saved under `filename`: a single-file `ZipStore`
+    for names ending in .zip, otherwise whatever zarr makes of `filename`
+    (a directory tree for paths, memory for None).
+
+    :param filename:
+    :param mode: 'w' to create the archive, 'r' to read it
+    :type mode: str
+    """
+    if isinstance(filename, str) and filename.endswith('.zip'):
+        return zarr.storage.ZipStore(filename, mode=mode)
+    return filename
+
+# The kernels below are compiled at import for explicit signatures covering the
+# dtypes the models use (see `Simulation.values_dtype`) and cached on disk, so
+# runs never pay JIT latency; a model with a new lattice dtype needs its
+# signatures added.
+
+# clean_boundary_inplace: every dtype both with and without an explicit `fill_value`
+_CLEAN_BOUNDARY_SIGNATURES = [
+    signature
+    for dtype in (numba.types.boolean, numba.types.uint8, numba.types.int32, numba.types.int64, numba.types.float64)
+    for signature in (dtype[:, :](dtype[:, :], numba.types.int64, dtype),
+                      dtype[:, :](dtype[:, :], numba.types.int64, numba.types.Omitted(False)))
+]
+
+@numba.njit(_CLEAN_BOUNDARY_SIGNATURES, cache=True, boundscheck=False, fastmath=True)
 def clean_boundary_inplace(array: np.ndarray, boundary_size: int, fill_value = False) -> np.ndarray:
     """
     Fill `array` at the boundary with `fill_value`.
@@ -236,9 +524,141 @@ def clean_boundary_inplace(array: np.ndarray, boundary_size: int, fill_value = F
     :param fill_value:
     :rtype: np.ndarray
     """
-    array[:boundary_size, :] = fill_value
-    array[-boundary_size:, :] = fill_value
-    array[:, :boundary_size] = fill_value
-    array[:, -boundary_size:] = fill_value
+    width, height = array.shape
+    # full rows at the top and bottom...
+    for i in range(boundary_size):
+        for j in range(height):
+            array[i, j] = fill_value
+            array[width - 1 - i, j] = fill_value
+    # ...then only the side columns in between, so corners are written once
+    for i in range(boundary_size, width - boundary_size):
+        for j in range(boundary_size):
+            array[i, j] = fill_value
+            array[i, height - 1 - j] = fill_value
     return array
 
+
+@numba.njit('void(u8[:], i8, i8, i8)', cache=True, boundscheck=False, fastmath=True)
+def mark_visited(visited: np.ndarray, x: int, y: int, width: int):
+    """
+    Set the bit for site `(x, y)` in the packed `visited` bitset.
+
+    :param visited: flat uint64 array, one bit per site of the lattice
+    :type visited: np.ndarray
+    :param x:
+    :type x: int
+    :param y:
+    :type y: int
+    :param width: second dimension of the lattice (with boundaries)
+    :type width: int
+    """
+    k = x * width + y
+    visited[k >> 6] |= np.uint64(1) << np.uint64(k & 63)
+
+_M1 = np.uint64(0x5555555555555555)
+_M2 = np.uint64(0x3333333333333333)
+_M4 = np.uint64(0x0f0f0f0f0f0f0f0f)
+_H01 = np.uint64(0x0101010101010101)
+
+@numba.njit('i8(u8[:])', cache=True, boundscheck=False, fastmath=True)
+def count_visited(visited: np.ndarray) -> int:
+    """
+    Count the sites marked in the packed `visited` bitset (SWAR popcount).
+
+    :param visited: flat uint64 array, one bit per site of the lattice
+    :type visited: np.ndarray
+    :rtype: int
+    """
+    total = np.uint64(0)
+    for word in visited:
+        word = word - ((word >> np.uint64(1)) & _M1)
+        word = (word & _M2) + ((word >> np.uint64(2)) & _M2)
+        word = (word + (word >> np.uint64(4))) & _M4
+        total += (word * _H01) >> np.uint64(56)
+    return int(total)
+
+# side of the square blocks `find_active_sites` scans the lattice in;
+# a 64x64 block plus its halo stays in L1 for the neighbor updates
+TILE = 64
+
+@numba.njit(['i8[:, :](u1[:, :], i8, i8, b1)',
+             'i8[:, :](i8[:, :], i8, i8, b1)',
+             'i8[:, :](f8[:, :], f8, i8, b1)'],
+            cache=True, boundscheck=False, fastmath=True)
+def find_active_sites(values: np.ndarray, critical_value, boundary_size: int, inclusive: bool) -> np.ndarray:
+    """
+    Find overloaded sites inside the boundary, scanning in `TILE` x `TILE` blocks.
+
+    Replaces building a thresholded boolean array, cleaning its boundary
+    and calling `np.where` with a single pass and no temporaries.
+    Sites come out grouped by block, so toppling them in order keeps
+    the neighbor updates local in cache.
+
+    :param values: data array of the simulation
+    :type values: np.ndarray
+    :param critical_value: sites topple above this value
+    :param boundary_size: size of boundary for the array
+    :type boundary_size: int
+    :param inclusive: if True, sites equal to `critical_value` are active too
+    :type inclusive: bool
+    :rtype: np.ndarray
+    :returns: a Nx2 array of integer indices for overloaded sites
+    """
+    width, height = values.shape
+    indices = np.empty(((width - 2 * boundary_size) * (height - 2 * boundary_size), 2), dtype=np.int64)
+    N = 0
+    for bx in range(boundary_size, width - boundary_size, TILE):
+        for by in range(boundary_size, height - boundary_size, TILE):
+            for x in range(bx, min(bx + TILE, width - boundary_size)):
+                for y in range(by, min(by + TILE, height - boundary_size)):
+                    if values[x, y] > critical_value or (inclusive and values[x, y] == critical_value):
+                        indices[N, 0] = x
+                        indices[N, 1] = y
+                        N += 1
+    return indices[:N]
+
+@numba.njit(['b1(u1[:, :], u8[:], i8, i8)',
+             'b1(i8[:, :], u8[:], i8, i8)'],
+            cache=True, boundscheck=False, fastmath=True)
+def parallel_topple(values: np.ndarray, visited: np.ndarray, critical_value, boundary_size: int) -> bool:
+    """
+    Topple every overloaded site at once, sending one grain to each of its four neighbors.
+
+    Branchless parallel-update BTW step: the overloaded sites are first
+    collected into a 0/1 mask, then every site adds the mask of its
+    four neighbors and subtracts four times its own. Both passes are
+    straight loops without data-dependent branches, which Numba can
+    vectorize.
+
+    Returns True/False: should we continue checking if something needs toppling?
+
+    :param values: data array of the simulation
+    :type values: np.ndarray
+    :param visited: packed bitset of visited sites; sites receiving grains get marked
+    :type visited: np.ndarray
+    :param critical_value: sites topple above this value
+    :param boundary_size: size of boundary for the array
+    :type boundary_size: int
+    :rtype: bool
+    """
+    width, height = values.shape
+    # overflow[x + 1, y + 1] is 1 where site (x, y) topples;
+    # the extra ring of zeros spares the second pass any edge checks
+    overflow = np.zeros((width + 2, height + 2), dtype=values.dtype)
+    any_active = False
+    for x in range(boundary_size, width - boundary_size):
+        for y in range(boundary_size, height - boundary_size):
+            active = values[x, y] > critical_value
+            overflow[x + 1, y + 1] = active
+            any_active |= active
+    if not any_active:
+        return False
+
+    for x in range(width):
+        for y in range(height):
+            received = (overflow[x, y + 1] + overflow[x + 2, y + 1]
+                        + overflow[x + 1, y] + overflow[x + 1, y + 2])
+            values[x, y] += received - 4 * overflow[x + 1, y + 1]
+            k = x * height + y
+            visited[k >> 6] |= np.uint64(received > 0) << np.uint64(k & 63)
+    return True
@@ -17,7 +17,7 @@ def SandFalling(matrix, count = 1):
     matrix[int((dim[0] - 1) / 2), int((dim[0] - 1) / 2)] += count
 
 
-@numba.njit
+@numba.njit(cache=True)
 def OneTimeStepSimulation(matrixOrig, thresholdValue = 4):
     """OneTimeStepSimulation"""
     # avalancheCount = 0
@@ -19,7 +19,7 @@ class BTW(common.Simulation):
         self.d = 2 #lattice dimmension 
         self.q = 2*self.d #grains amount used at driving 
         self.z_c = self.q #critical slope
-        self.values = np.zeros((self.L_with_boundary, self.L_with_boundary), dtype=int)
+        self.values = np.zeros((self.L_with_boundary, self.L_with_boundary), dtype=self.values_dtype())
 
     def adjacent_indexes(self, x, y):
         """
@@ -45,60 +45,38 @@ class BTW(common.Simulation):
                 if self.values[x_ad, y_ad] > val:
                     self.values[x_ad, y_ad] - 1
 
-    def topple_dissipate(self) -> bool:
+    def topple_dissipate(self) -> int:
         """
         Distribute material from overloaded sites to neighbors.
 
-        Convenience wrapper for the numba.njitted `topple` function defined in `manna.py`.
+        Convenience wrapper for the numba.njitted `avalanche` function defined in `btw.py`.
 
-        :rtype: bool
+        :rtype: int
         """
+        return avalanche(self.values, self.visited, self.z_c, self.BOUNDARY_SIZE)
 
 
-
-        return topple(self.values, self.visited, self.z_c, self.BOUNDARY_SIZE)    
-
-
-
-@numba.njit
-def topple(values: np.ndarray, visited: np.ndarray, critical_value: int, boundary_size: int) -> bool:
+@numba.njit('i8(u1[:, :], u8[:], i8, i8)', cache=True, boundscheck=False, fastmath=True)
+def avalanche(values: np.ndarray, visited: np.ndarray, critical_value: int, boundary_size: int) -> int:
     """
-    Distribute material from overloaded sites to neighbors.
+    Topple repeatedly until no site is overloaded, without leaving nopython mode,
+    then dissipate the grains that fell onto the boundary.
 
-    Returns True/False: should we continue checking if something needs toppling?
+    Returns the number of toppling iterations the avalanche took.
 
     :param values: data array of the simulation
     :type values: np.ndarray
-    :param visited: boolean array, needs to be cleaned beforehand
+    :param visited: packed bitset of visited sites, needs to be cleaned beforehand
     :type visited: np.ndarray
     :param critical_value: nodes topple above this value
     :type critical_value: int
     :param boundary_size: size of boundary for the array
     :type boundary_size: int
-    :rtype: bool
+    :rtype: int
     """
-
-    # find a boolean array of active (overloaded) sites
-    active_sites = common.clean_boundary_inplace(values > critical_value, boundary_size)
-    # odrzucam 
-
-
-    if active_sites.any():
-        indices = np.vstack(np.where(active_sites)).T
-        # a Nx2 array of integer indices for overloaded sites
-        N = indices.shape[0]
-
-        for i in range(N):
-            x, y = index = indices[i]
-
-            values[x, y] -= critical_value # zależy od parametru?
-
-            neighbors = np.array([(x - 1, y), (x, y - 1), (x + 1, y), (x, y + 1)])
-
-            for j in range(len(neighbors)):
-                xn, yn = neighbors[j]
-                values[xn, yn] += 1
-                visited[xn, yn] = True
-        return True
-    else:
-        return False # nothing happened, we can stop toppling
+    number_of_topple_iterations = 0
+    while common.parallel_topple(values, visited, critical_value, boundary_size):
+        number_of_topple_iterations += 1
+    # the boundary is a sink; emptying it keeps small integer dtypes from overflowing
+    common.clean_boundary_inplace(values, boundary_size, 0)
+    return number_of_topple_iterations
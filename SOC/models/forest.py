@@ -17,13 +17,13 @@ class Forest(common.Simulation):
         """
        
         super().__init__(*args, **kwargs)
-        self.values = np.zeros((self.L_with_boundary, self.L_with_boundary), dtype=int)
+        self.values = np.zeros((self.L_with_boundary, self.L_with_boundary), dtype=self.values_dtype())
         # probabilities = np.random.random(size=(self.L, self.L))
         # trees_here = probabilities <= p
         # self.values[self.BC:self.L_with_boundary - self.BC,
         #             self.BC:self.L_with_boundary - self.BC,
         #             ][trees_here] = _tree
-        self.values = common.clean_boundary_inplace(np.random.choice([_ash, _tree, _burning], self.values.shape, p=[0.99, 0.01, 0]), self.BC)
+        self.values = common.clean_boundary_inplace(np.random.choice([_ash, _tree, _burning], self.values.shape, p=[0.99, 0.01, 0]).astype(self.values_dtype()), self.BC)
         self.new_values = np.zeros_like(self.values)
         self.p = p
         self.f = f
@@ -66,11 +66,11 @@ class Forest(common.Simulation):
 
         self.values, self.new_values = self.new_values, self.values
         self.new_values[...] = 0
-        number_burning = (self.values[self.BC:-self.BC, self.BC:-self.BC] == _burning).sum()
+        number_burning = (self.interior == _burning).sum()
         return number_burning
 
 _neighbours = ((-1,-1), (-1,0), (-1,1), (0,-1), (0, 1), (1,-1), (1,0), (1,1))
-@numba.njit
+@numba.njit('void(u1[:, :], u1[:, :], f8, i8)', cache=True, boundscheck=False)
 def burn_trees(new_values, values, f, BC):
     for ix in range(BC, values.shape[0] - BC):
         for iy in range(BC, values.shape[1] - BC):
@@ -7,7 +7,10 @@ import random
 
 class Manna(common.Simulation):
     """Implements the Manna model."""
-    
+
+    # largest critical value still simulated on a uint8 lattice
+    NARROW_CRITICAL_VALUE = 64
+
     def __init__(self, critical_value: int = 1, abelian: bool = True, *args, **kwargs):
         """
         :param L: linear size of lattice, without boundary layers
@@ -18,9 +21,29 @@ class Manna(common.Simulation):
         :type abelian: bool
         """
         super().__init__(*args, **kwargs)
-        self.values = np.zeros((self.L_with_boundary, self.L_with_boundary), dtype=int)
         self.critical_value = critical_value
         self.abelian = abelian
+        self.values = np.zeros((self.L_with_boundary, self.L_with_boundary), dtype=self.lattice_dtype(critical_value))
+
+    @classmethod
+    def lattice_dtype(cls, critical_value: int) -> np.dtype:
+        """
+        Dtype of the lattice for sites toppling above `critical_value`.
+
+        Piles are not bounded by one toppling sweep: a site can keep gathering
+        grains from its neighbors over many sweeps before it topples, and a
+        nonabelian site passes on its whole pile. There is no tight bound to
+        size the lattice from, so uint8 is kept only for thresholds up to
+        `NARROW_CRITICAL_VALUE`, about a quarter of its range; larger ones
+        get int64.
+
+        :param critical_value: nodes topple above this value
+        :type critical_value: int
+        :rtype: np.dtype
+        """
+        if critical_value <= cls.NARROW_CRITICAL_VALUE:
+            return cls.values_dtype()
+        return np.dtype(np.int64)
 
     def drive(self, num_particles: int = 1):
         """
@@ -45,7 +68,9 @@ class Manna(common.Simulation):
 
 _DEBUG = True
 
-@numba.njit
+@numba.njit(['i8(u1[:, :], u8[:], i8, b1, i8)',
+             'i8(i8[:, :], u8[:], i8, b1, i8)'],
+            cache=True, boundscheck=False, fastmath=True)
 def topple_dissipate(values: np.ndarray, visited: np.ndarray, critical_value: int, abelian: bool, boundary_size: int) -> bool:
 
     """
@@ -55,7 +80,7 @@ def topple_dissipate(values: np.ndarray, visited: np.ndarray, critical_value: in
 
     :param values: data array of the simulation
     :type values: np.ndarray
-    :param visited: boolean array, needs to be cleaned beforehand
+    :param visited: packed bitset of visited sites, needs to be cleaned beforehand
     :type visited: np.ndarray
     :param critical_value: nodes topple above this value
     :type critical_value: int
@@ -67,15 +92,11 @@ def topple_dissipate(values: np.ndarray, visited: np.ndarray, critical_value: in
     """
 
     number_of_topple_iterations = 0
-    # find a boolean array of active (overloaded) sites
-    active_sites = common.clean_boundary_inplace(values > critical_value, boundary_size)   # TODO speedup?
-    # odrzucam 
-
-    while active_sites.any():   # TODO speedup?
-        indices = np.vstack(np.where(active_sites)).T   # TODO speedup?
-        # a Nx2 array of integer indices for overloaded sites
-        N = indices.shape[0]
+    # a Nx2 array of integer indices for active (overloaded) sites
+    indices = common.find_active_sites(values, critical_value, boundary_size, False)
+    N = indices.shape[0]
 
+    while N:
         for i in range(N):
             x, y = index = indices[i]
 
@@ -100,11 +121,15 @@ def topple_dissipate(values: np.ndarray, visited: np.ndarray, critical_value: in
             for j in range(len(neighbors)):
                 xn, yn = neighbors[j]
                 values[xn, yn] += 1
-                visited[xn, yn] = True
+                if _DEBUG:
+                    # a uint8 pile that overflows wraps around to 0
+                    assert values[xn, yn] != 0
+                common.mark_visited(visited, xn, yn, values.shape[1])
             
         number_of_topple_iterations += 1
-        active_sites = common.clean_boundary_inplace(values > critical_value, boundary_size)
-    # dissipate would be here, after the while loop
-    # but it's not necessary so we skip it
+        indices = common.find_active_sites(values, critical_value, boundary_size, False)
+        N = indices.shape[0]
+    # dissipate: the boundary is a sink; emptying it keeps small integer dtypes from overflowing
+    common.clean_boundary_inplace(values, boundary_size, 0)
     return number_of_topple_iterations
 
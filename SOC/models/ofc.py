@@ -23,11 +23,15 @@ class OFC(common.Simulation):
         """
         super().__init__(*args, **kwargs)
         self.critical_value = critical_value
-        self.values = np.random.rand(self.L_with_boundary, self.L_with_boundary) * self.critical_value
+        self.values = (np.random.rand(self.L_with_boundary, self.L_with_boundary) * self.critical_value).astype(self.values_dtype())
         self.conservation_lvl = conservation_lvl
         
         self.critical_value_current = self.critical_value
         
+    @classmethod
+    def values_dtype(cls) -> np.dtype:
+        return np.dtype(np.float64)
+
     def drive(self):
         """
         Drive the simulation by adding force from the outside.
@@ -35,29 +39,29 @@ class OFC(common.Simulation):
         """
         
         #decreasing critical_value to the max_value
-        max_value = np.max(self.values[self.BC:-self.BC, self.BC:-self.BC])
+        max_value = np.max(self.interior)
         self.critical_value_current = max_value
         
         # TODO MAYBE random loading vs obecnie zrobiony homogeneous loading?
 
         # TODO lista kandydatów do pękania?
         
-    def topple_dissipate(self) -> bool:
+    def topple_dissipate(self) -> int:
         """
         Distribute material from overloaded sites to neighbors.
 
-        Convenience wrapper for the numba.njitted `topple` function defined in `ofc.py`.
+        Convenience wrapper for the numba.njitted `avalanche` function defined in `ofc.py`.
 
-        :rtype: bool
+        :rtype: int
         """
-        return topple(self.values, self.visited, self.releases, self.critical_value_current, self.critical_value, self.conservation_lvl, self.BC)
+        return avalanche(self.values, self.visited, self.releases, self.critical_value_current, self.critical_value, self.conservation_lvl, self.BC)
 
     def _save_snapshot(self, i):
-        self.saved_snapshots[i // self.save_every] = self.values - self.critical_value_current
+        self._buffer_snapshot(self.values - self.critical_value_current)
 
 _DEBUG = True
 
-@numba.njit
+@numba.njit('b1(f8[:, :], u8[:], i8[:, :], f8, f8, f8, i8)', cache=True, boundscheck=False, fastmath=True)
 def topple(values: np.ndarray, visited: np.ndarray, releases: np.ndarray, critical_value_current: float, critical_value: float, conservation_lvl: float, boundary_size: int) -> bool:
     """
     Distribute material from overloaded sites to neighbors.
@@ -66,7 +70,7 @@ def topple(values: np.ndarray, visited: np.ndarray, releases: np.ndarray, critic
 
     :param values: data array of the simulation
     :type values: np.ndarray
-    :param visited: boolean array, needs to be cleaned beforehand
+    :param visited: packed bitset of visited sites, needs to be cleaned beforehand
     :type visited: np.ndarray
     :param critical_value: nodes topple above this value
     :type critical_value: float
@@ -77,17 +81,14 @@ def topple(values: np.ndarray, visited: np.ndarray, releases: np.ndarray, critic
     :rtype: bool
     """
 
-    # find a boolean array of active (overloaded) sites
-    active_sites = common.clean_boundary_inplace(values >= critical_value_current, boundary_size)
-    releases += active_sites
+    # a Nx2 array of integer indices for active (overloaded) sites
+    indices = common.find_active_sites(values, critical_value_current, boundary_size, True)
+    N = indices.shape[0]
 
-    if active_sites.any():
-        indices = np.vstack(np.where(active_sites)).T
-        # a Nx2 array of integer indices for overloaded sites
-        N = indices.shape[0]
-        
+    if N:
         for i in range(N):
             x, y = index = indices[i]
+            releases[x, y] += 1
 
             if _DEBUG:
                 width, height = values.shape
@@ -101,7 +102,7 @@ def topple(values: np.ndarray, visited: np.ndarray, releases: np.ndarray, critic
             for j in range(len(neighbors)):
                 xn, yn = neighbors[j]
                 values[xn, yn] += conservation_lvl * (values[x, y] - critical_value_current + critical_value)   # Grassberger (1994), eqns (1)
-                visited[xn, yn] = True
+                common.mark_visited(visited, xn, yn, values.shape[1])
             
             values[x, y] = critical_value_current - critical_value  # Grassberger (1994), eqns (1)
     
@@ -109,4 +110,30 @@ def topple(values: np.ndarray, visited: np.ndarray, releases: np.ndarray, critic
     else:
         return False # nothing happened, we can stop toppling
 
+@numba.njit('i8(f8[:, :], u8[:], i8[:, :], f8, f8, f8, i8)', cache=True, boundscheck=False, fastmath=True)
+def avalanche(values: np.ndarray, visited: np.ndarray, releases: np.ndarray, critical_value_current: float, critical_value: float, conservation_lvl: float, boundary_size: int) -> int:
+    """
+    Topple repeatedly until no site is overloaded, without leaving nopython mode.
+
+    Returns the number of toppling iterations the avalanche took.
+
+    :param values: data array of the simulation
+    :type values: np.ndarray
+    :param visited: packed bitset of visited sites, needs to be cleaned beforehand
+    :type visited: np.ndarray
+    :param releases: integer array counting releases per site, needs to be cleaned beforehand
+    :type releases: np.ndarray
+    :param critical_value: nodes topple above this value
+    :type critical_value: float
+    :param conservation_lvl: fraction of the force from a toppling site going to its neighbour
+    :type conservation_lvl: float
+    :param boundary_size: size of boundary for the array
+    :type boundary_size: int
+    :rtype: int
+    """
+    number_of_topple_iterations = 0
+    while topple(values, visited, releases, critical_value_current, critical_value, conservation_lvl, boundary_size):
+        number_of_topple_iterations += 1
+    return number_of_topple_iterations
+
 # TODO inna wartość krytyczna na start niż w czasie topplowania jako wariant?
@@ -10,3 +10,19 @@ def test_boundary_shape():
 def test_run():
     sim = BTW(10)
     sim.run(10)
+
+def test_avalanche_relaxes_lattice():
+    sim = BTW(10)
+    sim.values[1:-1, 1:-1] = 5
+    results = sim.AvalancheLoop()
+    assert (sim.values[1:-1, 1:-1] <= sim.z_c).all()
+    assert results["number_of_iterations"] > 1
+
+def test_boundary_dissipates():
+    sim = BTW(10)
+    assert sim.values.dtype == np.uint8
+    sim.values[1:-1, 1:-1] = 4
+    sim.values[1, 1] = 5
+    sim.AvalancheLoop()
+    interior_grains = sim.values[1:-1, 1:-1].sum()
+    assert sim.values.sum() == interior_grains < 4 * 100 + 1
@@ -1,6 +1,9 @@
 from SOC.models import Manna
+from SOC.models.manna import topple_dissipate
+from SOC.common.simulation import _seed_numba
 import numpy as np
 import pytest
+import zarr
 
 def test_boundary_shape():
     sim = Manna(L=10)
@@ -63,3 +66,129 @@ def test_resurrect_default_name():
     sim2 = Manna.from_file(filename)
     np.testing.assert_allclose(sim2.values, saved)
     assert sim2.save_every == save_every_orig
+
+def test_buffered_snapshots_cover_every_iteration():
+    # nothing topples, so every grain stays where it was dropped
+    sim = Manna(L=10, critical_value=100)
+    sim.SNAPSHOT_CHUNK_BYTES = 3 * sim.L_with_boundary**2 * sim.values.dtype.itemsize
+    sim.run(7, wait_for_n_iters=0)
+    assert sim.saved_snapshots.chunks[0] == 3
+    np.testing.assert_array_equal(sim.saved_snapshots[:].sum(axis=(1, 2)), np.arange(1, 8))
+    np.testing.assert_array_equal(sim.saved_snapshots[-1], sim.values)
+
+def test_custom_snapshot_chunks():
+    sim = Manna(L=10, critical_value=100, snapshot_chunks=(4, 6, 6))
+    sim.run(10, wait_for_n_iters=0)
+    assert sim.saved_snapshots.chunks == (4, 6, 6)
+    np.testing.assert_array_equal(sim.saved_snapshots[:].sum(axis=(1, 2)), np.arange(1, 11))
+
+def test_observables_collected_after_thermalization():
+    sim = Manna(L=10)
+    sim.run(20, wait_for_n_iters=5)
+    sim.run(10, wait_for_n_iters=0)
+    df = sim.data_df
+    assert len(df) == 30
+    assert list(df.columns) == list(Manna.OBSERVABLES)
+
+def test_quiet_drive_skips_avalanche_bookkeeping():
+    sim = Manna(L=10)
+    assert sim.AvalancheLoop() == dict(AvalancheSize=0, NumberOfReleases=0, number_of_iterations=0)
+    sim.values[1:-1, 1:-1] = 2
+    results = sim.AvalancheLoop()
+    assert results['AvalancheSize'] > 0
+    assert not sim.visited.any()
+
+def test_resurrect_zip(tmp_path):
+    sim = Manna(L=10)
+    filename = str(tmp_path / "test_resurrect.zip")
+    sim.run(5, filename=filename)
+    saved = sim.saved_snapshots[-1].copy()
+
+    sim2 = Manna.from_file(filename)
+    np.testing.assert_allclose(sim2.values, saved)
+    assert sim2.save_every == sim.save_every
+
+def test_run_ensemble():
+    data = Manna.run_ensemble(20, K=3, n_workers=2, wait_for_n_iters=0, L=10)
+    assert set(data) == set(Manna.OBSERVABLES)
+    assert all(len(column) == 60 for column in data.values())
+
+def test_animation_colour_limits_are_exact():
+    sim = Manna(L=10, critical_value=100)
+    sim.SNAPSHOT_CHUNK_BYTES = 3 * sim.L_with_boundary**2 * sim.values.dtype.itemsize
+    sim.run(20, wait_for_n_iters=0)
+    anim = sim.animate_states()
+    image = anim._fig.axes[0].images[0]
+    interior = sim.saved_snapshots[:, 1:-1, 1:-1]
+    assert image.norm.vmin == interior.min()
+    assert image.norm.vmax == interior.max()
+
+def test_large_critical_value_widens_lattice():
+    assert Manna(L=10).values.dtype == np.uint8
+    sim = Manna(L=10, critical_value=300)
+    assert sim.values.dtype == np.int64
+    sim.values[5, 5] = 301
+    results = sim.AvalancheLoop()
+    assert results['number_of_iterations'] > 0
+    assert (sim.values[1:-1, 1:-1] <= 300).all()
+
+@pytest.mark.parametrize("abelian", [True, False])
+def test_near_threshold_uint8_lattice_matches_int64(abelian):
+    critical_value = Manna.NARROW_CRITICAL_VALUE
+    assert Manna(L=10, critical_value=critical_value).values.dtype == np.uint8
+    assert Manna(L=10, critical_value=critical_value + 1).values.dtype == np.int64
+
+    # every site starts above threshold, so piles build up over many sweeps
+    runs = []
+    for dtype in (np.uint8, np.int64):
+        sim = Manna(L=20, critical_value=critical_value, abelian=abelian)
+        sim.values = sim.values.astype(dtype)
+        sim.values[1:-1, 1:-1] = critical_value + 1
+        _seed_numba(0)
+        runs.append((topple_dissipate(sim.values, sim.visited, critical_value, abelian, sim.BOUNDARY_SIZE),
+                     sim.values.astype(np.int64)))
+    (narrow_iterations, narrow), (wide_iterations, wide) = runs
+    assert narrow_iterations == wide_iterations > 1
+    np.testing.assert_array_equal(narrow, wide)
+
+def test_resurrect_int64_store_and_keep_running(tmp_path):
+    filename = str(tmp_path / "old.zarr")
+    old = zarr.open(filename, shape=(3, 12, 12), dtype=np.int64, attributes={'save_every': 1})
+    old[:] = 0
+    old[-1, 1:-1, 1:-1] = 1
+
+    sim = Manna.from_file(filename)
+    assert sim.values.dtype == np.uint8
+    np.testing.assert_array_equal(sim.values, old[-1])
+    sim.run(10, filename=str(tmp_path / "new.zarr"))
+
+    # 290 does not fit in uint8 and must not quietly wrap around to 34
+    old[-1, 5, 5] = 290
+    with pytest.raises(ValueError, match="outside the range"):
+        Manna.from_file(filename)
+
+class InterruptedManna(Manna):
+    """Manna that fails on its 31st drive."""
+    def drive(self, *args, **kwargs):
+        self.n_drives = getattr(self, 'n_drives', 0) + 1
+        if self.n_drives > 30:
+            raise KeyboardInterrupt
+        super().drive(*args, **kwargs)
+
+@pytest.mark.parametrize("name", ["interrupted.zarr", "interrupted.zip"])
+def test_interrupted_run_keeps_snapshots(tmp_path, name):
+    filename = str(tmp_path / name)
+    sim = InterruptedManna(L=10, critical_value=100)
+    with pytest.raises(KeyboardInterrupt):
+        sim.run(100, filename=filename)
+
+    saved = Manna.from_file(filename).saved_snapshots
+    # nothing topples, so snapshot i holds the i + 1 grains dropped so far
+    np.testing.assert_array_equal(saved[:30].sum(axis=(1, 2)), np.arange(1, 31))
+
+def test_from_file_closes_zip(tmp_path):
+    filename = str(tmp_path / "closed.zip")
+    Manna(L=10).run(5, filename=filename)
+    sim = Manna.from_file(filename)
+    assert not sim.saved_snapshots.store._is_open
+    np.testing.assert_array_equal(sim.saved_snapshots[-1], sim.values)
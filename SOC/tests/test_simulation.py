@@ -0,0 +1,49 @@
+from SOC.common import mark_visited, count_visited, clean_boundary_inplace, find_active_sites, parallel_topple
+from SOC.common import analysis
+import numpy as np
+import pytest
+
+def test_visited_bitset_matches_bool_array():
+    width = 13
+    reference = np.random.random((width, width)) < 0.3
+    visited = np.zeros((width**2 + 63) // 64, dtype=np.uint64)
+    for x, y in zip(*np.where(reference)):
+        mark_visited(visited, x, y, width)
+        mark_visited(visited, x, y, width)
+    assert count_visited(visited) == reference.sum()
+
+@pytest.mark.parametrize("boundary_size", [1, 2])
+@pytest.mark.parametrize("dtype", [bool, int, float])
+def test_clean_boundary_inplace(boundary_size, dtype):
+    array = np.ones((7, 9), dtype=dtype)
+    expected = np.zeros_like(array)
+    expected[boundary_size:-boundary_size, boundary_size:-boundary_size] = 1
+    result = clean_boundary_inplace(array, boundary_size)
+    assert result is array
+    np.testing.assert_array_equal(array, expected)
+
+@pytest.mark.parametrize("inclusive", [False, True])
+def test_find_active_sites_matches_np_where(inclusive):
+    values = np.random.randint(0, 4, size=(150, 140))
+    indices = find_active_sites(values, 2, 1, inclusive)
+    active = (values >= 2) if inclusive else (values > 2)
+    expected = np.vstack(np.where(clean_boundary_inplace(active, 1))).T
+    assert sorted(map(tuple, indices)) == sorted(map(tuple, expected))
+
+def test_parallel_topple_single_site():
+    values = np.zeros((5, 5), dtype=np.uint8)
+    values[2, 2] = 5
+    visited = np.zeros(1, dtype=np.uint64)
+    assert parallel_topple(values, visited, 4, 1)
+    expected = np.zeros((5, 5), dtype=np.uint8)
+    expected[2, 2] = 1
+    expected[1, 2] = expected[3, 2] = expected[2, 1] = expected[2, 3] = 1
+    np.testing.assert_array_equal(values, expected)
+    assert count_visited(visited) == 4
+    assert not parallel_topple(values, visited, 4, 1)
+
+def test_plot_histogram_small_integer_dtype():
+    data = {'AvalancheSize': np.array([1, 3, 40, 255], dtype=np.uint8)}
+    heights, bins, fig = analysis.plot_histogram(data, num=5, plot=False)
+    assert bins[-1] == pytest.approx(256)
+    assert heights[-1] == 1
@@ -33,12 +33,12 @@ setup(
         'Intended Audience :: Science/Research',
         'Topic :: Scientific/Engineering :: Physics'
         'License :: BSD 3-clause',
-        'Programming Language :: Python :: 3.7',
+        'Programming Language :: Python :: 3.11',
     ],
     keywords='self-organized-criticality sandpile forest-fire simulation',
     packages=find_packages(exclude=['docs', 'docsrc', 'research', 'resources','results']),
-    python_requires='>=3.6',
-    install_requires=['numpy', 'matplotlib', 'tqdm', 'numba', 'zarr'],
+    python_requires='>=3.11',
+    install_requires=['numpy', 'matplotlib', 'tqdm', 'numba', 'zarr>=3'],
     extras_require=extras_require,
 
     # To provide executable scripts, use entry points in preference to the